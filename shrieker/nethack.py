@@ -1,4 +1,5 @@
 import collections
+import io
 import logging
 import numpy as np
 import os
@@ -12,6 +13,34 @@ import vt102
 ROWS = 25
 COLS = 80
 
+# largest neighborhood radius served from the padded copy of the screen.
+_PAD = 8
+
+# bits for the boolean flags parsed out of an inventory item description.
+_CURSED, _UNCURSED, _BLESSED, _BEING_WORN, _IN_USE = 1, 2, 4, 8, 16
+_WIELDED, _ALTERNATE, _QUIVERED = 32, 64, 128
+
+# literal substrings that set each flag; descriptions are padded with spaces
+# before matching so that word boundaries can be checked with plain `in`.
+_FLAGS = ((' cursed ', _CURSED),
+          (' uncursed ', _UNCURSED),
+          (' blessed ', _BLESSED),
+          ('(being worn)', _BEING_WORN),
+          ('(in use)', _IN_USE),
+          ('(lit)', _IN_USE),
+          ('(weapon in hand)', _WIELDED),
+          ('(weapon in hands)', _WIELDED),
+          ('(alternate weapon; not wielded)', _ALTERNATE),
+          ('(in quiver)', _QUIVERED))
+
+# numeric fields. the enchantment is only looked for in the text before any
+# user-supplied name, since names can contain arbitrary text like "+3".
+_COUNT = re.compile(r'^(\d+) ')
+_ENCHANT = re.compile(r' ([-+]\d+) ')
+_NAME = re.compile(r' (?:named|called) ')
+_NAMED = re.compile(r' named ([^\(]+)')
+_CHARGES = re.compile(r'\((\d+):(\d+)\)')
+
 
 class CMD:
     class DIR:
@@ -48,9 +77,33 @@ class InventoryItem:
                   'Scrolls', 'Spellbooks', 'Potions', 'Rings',
                   'Wands', 'Tools', 'Gems')
 
+    __slots__ = ('raw', '_flags', '_count', '_enchant',
+                 '_charges_now', '_charges_max', '_named')
+
     def __init__(self, raw):
         self.raw = raw.strip()
 
+        padded = ' %s ' % self.raw
+        self._flags = 0
+        for literal, bit in _FLAGS:
+            if literal in padded:
+                self._flags |= bit
+
+        m = _COUNT.match(self.raw)
+        self._count = int(m.group(1)) if m else 1
+
+        m = _NAME.search(self.raw)
+        prefix = self.raw[:m.start() + 1] if m else self.raw + ' '
+        m = _ENCHANT.search(prefix)
+        self._enchant = int(m.group(1)) if m else None
+
+        m = _NAMED.search(self.raw)
+        self._named = m.group(1).strip() if m else None
+
+        m = _CHARGES.search(self.raw)
+        self._charges_now = int(m.group(1)) if m else None
+        self._charges_max = int(m.group(2)) if m else None
+
     def __str__(self):
         return self.raw
 
@@ -59,108 +112,180 @@ class InventoryItem:
 
     @property
     def is_cursed(self):
-        return re.search(r'\bcursed\b', self.raw)
+        return bool(self._flags & _CURSED)
 
     @property
     def is_uncursed(self):
-        return re.search(r'\buncursed\b', self.raw)
+        return bool(self._flags & _UNCURSED)
 
     @property
     def is_blessed(self):
-        return re.search(r'\bblessed\b', self.raw)
+        return bool(self._flags & _BLESSED)
 
     @property
     def is_being_worn(self):
-        return re.search(r'\(being worn\)', self.raw)
+        return bool(self._flags & _BEING_WORN)
 
     @property
     def is_in_use(self):
-        return re.search(r'\((?:in use|lit)\)', self.raw)
+        return bool(self._flags & _IN_USE)
 
     @property
     def duplicates(self):
-        m = re.match(r'^(\d+)', self.raw)
-        if not m:
-            return 1
-        return int(m.group(1))
+        return self._count
 
     @property
     def charges(self):
-        m = re.match(r'\((\d+):(\d+)\)', self.raw)
-        if not m:
-            return None, None
-        return int(m.group(1)), int(m.group(2))
+        return self._charges_now, self._charges_max
 
     @property
     def enchantment(self):
-        m = re.match(r' ([-+]\d+) ', self.raw)
-        if not m:
-            return None
-        return int(m.group(1))
+        return self._enchant
 
     @property
     def named(self):
-        m = re.match(r' named ([^\(]+)', self.raw)
-        if not m:
-            return None
-        return m.group(1)
+        return self._named
 
 
 class AmuletsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class ArmorItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class WeaponsItem(InventoryItem):
+    __slots__ = ()
+
     @property
     def is_wielded(self):
-        return re.search(r'\(weapon in hands?\)', self.raw)
+        return bool(self._flags & _WIELDED)
 
     @property
     def is_alternate(self):
-        return re.search(r'\(alternate weapon; not wielded\)', self.raw)
+        return bool(self._flags & _ALTERNATE)
 
     @property
     def is_quivered(self):
-        return re.search(r'\(in quiver\)', self.raw)
+        return bool(self._flags & _QUIVERED)
 
 
 class ComestiblesItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class ScrollsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class SpellbooksItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class PotionsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class RingsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class WandsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class ToolsItem(InventoryItem):
-    pass
+    __slots__ = ()
 
 
 class GemsItem(InventoryItem):
-    pass
+    __slots__ = ()
+
+
+_CATEGORY_CLASSES = dict((c, globals()['%sItem' % c])
+                         for c in InventoryItem.CATEGORIES)
+
+_CATEGORY_NAMES = re.compile(
+    b'|'.join(c.encode('utf-8') for c in InventoryItem.CATEGORIES))
+
+_INVENTORY_LINE = re.compile(br' (\w) - (.*?)(?=\x1b\[)')
+
+_ATTRIBUTES = re.compile(r'St:(?P<st>[/\d]+)\s*'
+                         r'Dx:(?P<dx>\d+)\s*'
+                         r'Co:(?P<co>\d+)\s*'
+                         r'In:(?P<in>\d+)\s*'
+                         r'Wi:(?P<wi>\d+)\s*'
+                         r'Ch:(?P<ch>\d+)\s*'
+                         r'(?P<align>\S+)')
+
+_STATS = re.compile(r'Dlvl:(?P<dlvl>\S+)\s*'
+                    r'\$:(?P<money>\d+)\s*'
+                    r'HP:(?P<hp>\d+)\((?P<hp_max>\d+)\)\s*'
+                    r'Pw:(?P<pw>\d+)\((?P<pw_max>\d+)\)\s*'
+                    r'AC:(?P<ac>\d+)\s*'
+                    r'Exp:(?P<exp>\d+)\s*'
+                    r'(?P<hunger>Satiated|Hungry|Weak|Fainting)?\s*'
+                    r'(?P<stun>Stun)?\s*'
+                    r'(?P<conf>Conf)?\s*'
+                    r'(?P<blind>Blind)?\s*'
+                    r'(?P<burden>Burdened|Stressed|Strained|Overtaxed|Overloaded)?\s*'
+                    r'(?P<hallu>Hallu)?\s*')
+
+# stats whose groups only match digits, so they can always be converted.
+_NUMERIC_STATS = ('money', 'hp', 'hp_max', 'pw', 'pw_max', 'ac', 'exp')
+
+# vt102 renders nethack's DECgraphics symbols as unicode line-drawing
+# characters; map them back to their plain ascii glyphs (or to 0 when there is
+# no unambiguous equivalent) so that every screen cell fits in a single byte.
+# walls become - or |, floor and doorways ., trees and iron bars #, and water
+# or lava }. open doors (checkerboard) are - or | depending on orientation, so
+# they map to 0, as does the unused circle.
+_GLYPH_TABLE = str.maketrans(
+    u'\u2500\u2502\u250c\u2510\u2514\u2518\u251c\u2524\u252c\u2534\u253c'
+    u'\u00b7\u00b1\u03c0\u25c6\u2592\u25cb',
+    u'-|----||---.##}\x00\x00')
+
+
+# copy vt102 display rows into a buffer of glyph codes. the whole screen is
+# joined and encoded in one shot rather than converting characters one at a
+# time; plain ascii screens (the usual case) skip the translation pass.
+def _load_glyphs(display, buf):
+    screen = ''.join(display)
+    if not screen.isascii():
+        screen = screen.translate(_GLYPH_TABLE)
+    buf[:] = screen.encode('latin1', 'replace')
+
+
+# render a 2d array of glyph codes as text, one line per row.
+def _glyph_text(glyphs):
+    cols = glyphs.shape[1]
+    text = glyphs.astype(np.uint8).tobytes().decode('latin1')
+    return '\n'.join(text[i:i + cols] for i in range(0, len(text), cols))
+
+
+# log argument whose text is only built if the record is actually emitted.
+class _Lazy:
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return self.func(*self.args)
+
+
+def _format_fields(fields):
+    return ', '.join('%s: %s' % (k, fields[k]) for k in sorted(fields))
 
 
 class Player:
+    __slots__ = ('_stream', '_screen', '_glyph_buf', '_padded',
+                 '_prev_glyphs', '_need_inventory', '_has_more', '_command',
+                 '_message_row', '_attributes_row', '_stats_row', 'glyphs',
+                 'messages', 'stats', 'inventory', 'spells', 'attributes')
+
     OPTIONS = ('CHARACTER={character}\n'
                'OPTIONS=hilite_pet,pickup_types:$?+!=/,'
                'gender:{gender},race:{race},align:{align}')
@@ -170,9 +295,19 @@ class Player:
         self._screen = vt102.screen((ROWS, COLS))
         self._screen.attach(self._stream)
 
+        # glyphs is a view of this buffer, so each frame is written in place.
+        self._glyph_buf = bytearray(ROWS * COLS)
+        self.glyphs = np.frombuffer(self._glyph_buf, np.uint8).reshape(
+            ROWS, COLS)
+        self._padded = np.zeros((ROWS + 2 * _PAD, COLS + 2 * _PAD), np.uint8)
+        self._prev_glyphs = np.zeros((ROWS, COLS), np.uint8)
+
         self._need_inventory = True
         self._has_more = False
         self._command = None
+        self._message_row = None
+        self._attributes_row = None
+        self._stats_row = None
 
         self.messages = collections.deque(maxlen=1000)
         self.stats = {}
@@ -202,31 +337,33 @@ class Player:
 
     def neighborhood(self, radius=3):
         x, y = self._screen.cursor()
-        ylo, yhi = y - radius, y + radius + 1
-        xlo, xhi = x - radius, x + radius + 1
-        ulo, uhi = 0, 2 * radius + 1
-        vlo, vhi = 0, 2 * radius + 1
-        if y < radius:
-            ylo, ulo = 0, radius - y
-        if x < radius:
-            xlo, vlo = 0, radius - x
-        if y > ROWS - radius:
-            yhi, uhi = ROWS, radius - (ROWS - y)
-        if x > COLS - radius:
-            xhi, vhi = COLS, radius - (COLS - x)
-        hood = np.zeros((2 * radius + 1, 2 * radius + 1), np.uint8)
-        hood[ulo:uhi, vlo:vhi] = self._screen.display[ylo:yhi][xlo:xhi]
+        size = 2 * radius + 1
+        if radius <= _PAD:
+            y, x = y + _PAD - radius, x + _PAD - radius
+            return self._padded[y:y + size, x:x + size].copy()
+        ylo, yhi = max(0, y - radius), min(ROWS, y + radius + 1)
+        xlo, xhi = max(0, x - radius), min(COLS, x + radius + 1)
+        ulo, vlo = ylo - (y - radius), xlo - (x - radius)
+        hood = np.zeros((size, size), np.uint8)
+        hood[ulo:ulo + yhi - ylo, vlo:vlo + xhi - xlo] = \
+            self.glyphs[ylo:yhi, xlo:xhi]
         return hood
 
     def _parse_inventory(self, raw):
         found_inventory = False
         for category in InventoryItem.CATEGORIES:
-            klass = eval('%sItem' % category)
-            contents = self.inventory.setdefault(category, {})
-            i = raw.find(category.encode('utf-8'))
-            if i > 0:
-                s = raw[i:].split(b'\x1b[7m')[0]
-                for letter, name in re.findall(br' (\w) - (.*?)(?=\x1b\[)', s):
+            self.inventory.setdefault(category, {})
+        seen = set()
+        for m in _CATEGORY_NAMES.finditer(raw):
+            category = m.group().decode('utf-8')
+            if category in seen:
+                continue
+            seen.add(category)
+            if m.start() > 0:
+                klass = _CATEGORY_CLASSES[category]
+                contents = self.inventory[category]
+                s = raw[m.start():].split(b'\x1b[7m')[0]
+                for letter, name in _INVENTORY_LINE.findall(s):
                     contents[letter.decode('utf-8')] = klass(name.decode('utf-8'))
                 logging.error('inventory for %s: %s', category, contents)
                 found_inventory = True
@@ -235,9 +372,20 @@ class Player:
     def _parse_glyphs(self, raw):
         self._stream.process(raw)
 
-        logging.info('current map:\n%s', self._screen.display)
-        logging.warn('current neighborhood:\n%s', '\n'.join(
-            ''.join(chr(c) for c in r) for r in self.neighborhood(3)))
+        _load_glyphs(self._screen.display, self._glyph_buf)
+        self._padded[_PAD:-_PAD, _PAD:-_PAD] = self.glyphs
+
+        logger = logging.getLogger()
+        if logger.isEnabledFor(logging.INFO):
+            changed = np.flatnonzero((self.glyphs != self._prev_glyphs).any(1))
+            if len(changed):
+                rows = self._screen.display
+                logging.info('changed map rows:\n%s', '\n'.join(
+                    '%02d: %s' % (y, rows[y]) for y in changed))
+            self._prev_glyphs[:] = self.glyphs
+        if logger.isEnabledFor(logging.WARN):
+            logging.warn('current neighborhood:\n%s',
+                         _glyph_text(self.neighborhood(3)))
 
         self._parse_message()
         self._parse_attributes()
@@ -246,6 +394,9 @@ class Player:
     def _parse_message(self):
         '''Parse a message from the first line on the screen.'''
         l = self._screen.display[0]
+        if l == self._message_row:
+            return
+        self._message_row = l
         if l.strip() and l[0].strip():
             logging.warn('message: %s', l)
             self.messages.append(l)
@@ -253,40 +404,29 @@ class Player:
     def _parse_attributes(self):
         '''Parse character attributes.'''
         l = self._screen.display[22]
-        m = re.search(r'St:(?P<st>[/\d]+)\s*'
-                      r'Dx:(?P<dx>\d+)\s*'
-                      r'Co:(?P<co>\d+)\s*'
-                      r'In:(?P<in>\d+)\s*'
-                      r'Wi:(?P<wi>\d+)\s*'
-                      r'Ch:(?P<ch>\d+)\s*'
-                      r'(?P<align>\S+)', l)
+        if l == self._attributes_row:
+            return
+        self._attributes_row = l
+        m = _ATTRIBUTES.search(l)
         if m:
             self.attributes = m.groupdict()
-            logging.warn('parsed attributes: %s', ', '.join('%s: %s' % (
-                k, self.attributes[k]) for k in sorted(self.attributes)))
+            logging.warn('parsed attributes: %s',
+                         _Lazy(_format_fields, self.attributes))
 
     def _parse_stats(self):
         '''Parse stats from the penultimate line.'''
         l = self._screen.display[23]
-        m = re.search(r'Dlvl:(?P<dlvl>\S+)\s*'
-                      r'\$:(?P<money>\d+)\s*'
-                      r'HP:(?P<hp>\d+)\((?P<hp_max>\d+)\)\s*'
-                      r'Pw:(?P<pw>\d+)\((?P<pw_max>\d+)\)\s*'
-                      r'AC:(?P<ac>\d+)\s*'
-                      r'Exp:(?P<exp>\d+)\s*'
-                      r'(?P<hunger>Satiated|Hungry|Weak|Fainting)?\s*'
-                      r'(?P<stun>Stun)?\s*'
-                      r'(?P<conf>Conf)?\s*'
-                      r'(?P<blind>Blind)?\s*'
-                      r'(?P<burden>Burdened|Stressed|Strained|Overtaxed|Overloaded)?\s*'
-                      r'(?P<hallu>Hallu)?\s*', l)
+        if l == self._stats_row:
+            return
+        self._stats_row = l
+        m = _STATS.search(l)
         if m:
             self.stats = m.groupdict()
-            for k, v in self.stats.items():
-                if v and v.isdigit():
-                    self.stats[k] = int(v)
-            logging.warn('parsed stats: %s', ', '.join(
-                '%s: %s' % (k, self.stats[k]) for k in sorted(self.stats)))
+            for k in _NUMERIC_STATS:
+                self.stats[k] = int(self.stats[k])
+            if self.stats['dlvl'].isdigit():
+                self.stats['dlvl'] = int(self.stats['dlvl'])
+            logging.warn('parsed stats: %s', _Lazy(_format_fields, self.stats))
 
     def _observe(self, raw):
         self._parse_glyphs(raw)
@@ -313,26 +453,43 @@ class Player:
         return self._command
 
 
+# the eight compass directions; getrandbits(3) indexes it uniformly.
+_DIRECTIONS = (CMD.DIR.N, CMD.DIR.NE, CMD.DIR.E, CMD.DIR.SE,
+               CMD.DIR.S, CMD.DIR.SW, CMD.DIR.W, CMD.DIR.NW)
+
+
 class RandomMover(Player):
+    __slots__ = ()
+
     def choose_answer(self):
         return 'n'
 
     def choose_action(self):
-        return random.choice([
-            CMD.DIR.N, CMD.DIR.NE, CMD.DIR.E, CMD.DIR.SE,
-            CMD.DIR.S, CMD.DIR.SW, CMD.DIR.W, CMD.DIR.NW,
-        ])
+        return _DIRECTIONS[random.getrandbits(3)]
+
+
+# shared read buffer for _drain; it doubles in size if a burst fills it.
+_BUF = bytearray(1 << 16)
 
 
 # drain all available bytes from the given file descriptor, until a complete
 # timeout goes by with no new data.
 def _drain(fd, timeout=0.3):
+    global _BUF
     more, _, _ = select.select([fd], [], [], timeout)
-    buf = b''
-    while more:
-        buf += os.read(fd, 1024)
-        more, _, _ = select.select([fd], [], [], timeout)
-    return buf
+    off = 0
+    with io.FileIO(fd, 'r', closefd=False) as f:
+        while more:
+            if off + 4096 > len(_BUF):
+                _BUF = _BUF + bytearray(len(_BUF))
+            with memoryview(_BUF) as view:
+                n = f.readinto(view[off:off + 4096])
+            if not n:
+                break
+            off += n
+            more, _, _ = select.select([fd], [], [], timeout)
+    with memoryview(_BUF) as view:
+        return view[:off].tobytes()
 
 
 # we almost want to do what pty.spawn does, except that we know how our child